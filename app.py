@@ -1,10 +1,12 @@
 ﻿import io
-import random
+import os
+from functools import partial
 from datetime import datetime
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
-import plotly.express as px
+import plotly.graph_objects as go
 import streamlit as st
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfbase import pdfmetrics
@@ -52,94 +54,116 @@ RANDOM_SUBJECTS = [
 
 SCORE_TYPES = ["Әріптік", "Сандық (0-100)"]
 PERIODS = ["Q1", "Q2", "Q3", "Q4", "S1", "S2"]
+RECORD_COLUMNS = ["subject", "credits", "score_type", "grade", "period"]
+PERIOD_ORDER = {"Q1": 1, "Q2": 2, "Q3": 3, "Q4": 4, "S1": 5, "S2": 6}
+PERIOD_TYPE_KZ = {"Quarter": "Тоқсан", "Semester": "Семестр", "Other": "Басқа"}
+CHART_ONLY_COLUMNS = ["period_order", "period_type_kz"]
+ARIAL_PATH = Path(r"C:\Windows\Fonts\arial.ttf")
 
 
-def parse_period(period_raw: str) -> tuple[str, str]:
-    value = (period_raw or "").strip().upper()
-    if value.startswith("Q"):
-        return "Quarter", value
-    if value.startswith("S"):
-        return "Semester", value
-    return "Other", value if value else "N/A"
-
+def normalize_df(df: pd.DataFrame) -> pd.DataFrame:
+    # Adds columns in place: callers pass a frame freshly built from the records.
+    data = df
+    # Credits come from st.number_input, so coercion is only needed for odd input.
+    if not pd.api.types.is_numeric_dtype(data["credits"]):
+        data["credits"] = pd.to_numeric(data["credits"], errors="coerce").fillna(0.0)
+
+    is_letter = data["score_type"].to_numpy() == "Әріптік"
+    grades = data["grade"].to_numpy()
+    gpa_points = np.empty(len(data), dtype=np.float32)
+    letters = pd.Series(grades[is_letter], dtype=object).astype(str).str.upper()
+    gpa_points[is_letter] = letters.map(LETTER_TO_POINTS).fillna(0.0).to_numpy()
+    numeric = pd.to_numeric(pd.Series(grades[~is_letter], dtype=object), errors="coerce").to_numpy()
+    gpa_points[~is_letter] = np.select(
+        [numeric >= 90, numeric >= 80, numeric >= 70, numeric >= 60],
+        [4.0, 3.0, 2.0, 1.0],
+        default=0.0,
+    )
+    data["gpa_points"] = gpa_points
+    data["weighted_points"] = data["gpa_points"] * data["credits"]
 
-def score_to_points(score_type: str, score_value: str | float | int) -> float:
-    if score_type == "Әріптік":
-        return LETTER_TO_POINTS.get(str(score_value).upper(), 0.0)
+    period = data["period"].fillna("").astype(str).str.strip().str.upper()
+    first_char = period.str[0]
+    data["period_type"] = np.where(
+        first_char == "Q", "Quarter", np.where(first_char == "S", "Semester", "Other")
+    )
+    data["period_name"] = np.where(period.eq(""), "N/A", period)
+    data["period_order"] = data["period_name"].map(PERIOD_ORDER).fillna(99).astype("int8")
+    data["period_type_kz"] = pd.Categorical(
+        data["period_type"].map(PERIOD_TYPE_KZ),
+        categories=list(PERIOD_TYPE_KZ.values()),
+        ordered=True,
+    )
 
-    numeric = float(score_value)
-    if numeric >= 90:
-        return 4.0
-    if numeric >= 80:
-        return 3.0
-    if numeric >= 70:
-        return 2.0
-    if numeric >= 60:
-        return 1.0
-    return 0.0
+    subject = data["subject"].fillna("").astype(str).str.strip()
+    data["subject_display"] = subject.map(EMOJI_MAP).fillna("📘").str.cat(subject, sep=" ")
 
+    # Low-cardinality text becomes categorical and weighted points fit in float32.
+    for column in ("subject", "score_type", "period", "period_type", "period_name"):
+        data[column] = data[column].astype("category")
+    data["weighted_points"] = data["weighted_points"].astype("float32")
+    return data
 
-def subject_with_emoji(subject: str) -> str:
-    s = (subject or "").strip()
-    icon = EMOJI_MAP.get(s, "📘")
-    return f"{icon} {s}"
 
+def compute_period_gpa(data: pd.DataFrame) -> pd.DataFrame:
+    codes = data["period_name"].cat.codes.to_numpy()
+    observed, first_rows = np.unique(codes, return_index=True)
+    total_weighted = np.bincount(codes, weights=data["weighted_points"].to_numpy(dtype=float))[observed]
+    total_credits = np.bincount(codes, weights=data["credits"].to_numpy(dtype=float))[observed]
 
-def normalize_df(df: pd.DataFrame) -> pd.DataFrame:
-    data = df.copy()
-    data["credits"] = pd.to_numeric(data["credits"], errors="coerce").fillna(0.0)
-    data["gpa_points"] = data.apply(
-        lambda row: score_to_points(row["score_type"], row["grade"]), axis=1
+    period_gpa = data.iloc[first_rows][
+        ["period_type", "period_name", "period_order", "period_type_kz"]
+    ].reset_index(drop=True)
+    period_gpa["total_weighted"] = total_weighted
+    period_gpa["total_credits"] = total_credits
+    period_gpa["gpa"] = np.divide(
+        total_weighted, total_credits, out=np.zeros_like(total_weighted), where=total_credits > 0
     )
-    data["weighted_points"] = data["gpa_points"] * data["credits"]
-    data[["period_type", "period_name"]] = data["period"].apply(parse_period).apply(pd.Series)
-    data["subject_display"] = data["subject"].apply(subject_with_emoji)
-    return data
+    return period_gpa
 
 
-def calculate_overall_gpa(data: pd.DataFrame) -> float:
-    total_credits = data["credits"].sum()
-    if total_credits <= 0:
-        return 0.0
-    return data["weighted_points"].sum() / total_credits
+def empty_records() -> dict[str, list]:
+    return {column: [] for column in RECORD_COLUMNS}
 
 
-def generate_random_records(size: int = 6) -> list[dict]:
-    records: list[dict] = []
-    for subject in random.sample(RANDOM_SUBJECTS, k=min(size, len(RANDOM_SUBJECTS))):
-        score_type = random.choice(SCORE_TYPES)
-        if score_type == "Әріптік":
-            grade = random.choice(["A", "B", "C", "D", "F"])
-        else:
-            grade = random.randint(55, 100)
-
-        records.append(
-            {
-                "subject": subject,
-                "credits": random.choice([2, 3, 4]),
-                "score_type": score_type,
-                "grade": grade,
-                "period": random.choice(PERIODS),
-            }
-        )
-    return records
+def append_record(records: dict[str, list], record: dict) -> None:
+    for column in RECORD_COLUMNS:
+        records[column].append(record[column])
+
+
+def generate_random_records(size: int = 6) -> dict[str, list]:
+    rng = np.random.default_rng()
+    size = min(size, len(RANDOM_SUBJECTS))
+    score_types = rng.choice(SCORE_TYPES, size=size)
+    letters = rng.choice(["A", "B", "C", "D", "F"], size=size)
+    numbers = rng.integers(55, 101, size=size)
+    return {
+        "subject": rng.choice(RANDOM_SUBJECTS, size=size, replace=False).tolist(),
+        "credits": rng.choice([2, 3, 4], size=size).tolist(),
+        "score_type": score_types.tolist(),
+        "grade": np.where(score_types == "Әріптік", letters, numbers.astype(object)).tolist(),
+        "period": rng.choice(PERIODS, size=size).tolist(),
+    }
+
+
+@st.cache_resource(show_spinner=False)
+def _register_pdf_font() -> str:
+    # Try to use Arial from Windows to support Cyrillic/Kazakh text.
+    if os.name != "nt" or not ARIAL_PATH.exists():
+        return "Helvetica"
+    pdfmetrics.registerFont(TTFont("ArialUnicode", str(ARIAL_PATH)))
+    return "ArialUnicode"
+
+
+FONT_NAME = _register_pdf_font()
 
 
 def build_pdf_bytes(report_df: pd.DataFrame, student_info: dict) -> bytes:
     buffer = io.BytesIO()
     pdf = canvas.Canvas(buffer, pagesize=A4)
     _, page_height = A4
-    y = page_height - 40
-
-    # Try to use Arial from Windows to support Cyrillic/Kazakh text.
-    font_name = "Helvetica"
-    arial_path = Path(r"C:\Windows\Fonts\arial.ttf")
-    if arial_path.exists():
-        pdfmetrics.registerFont(TTFont("ArialUnicode", str(arial_path)))
-        font_name = "ArialUnicode"
 
     pdf.setTitle("GPA және үлгерім есебі")
-    pdf.setFont(font_name, 12)
 
     lines = [
         "GPA және үлгерім есебі",
@@ -154,37 +178,126 @@ def build_pdf_bytes(report_df: pd.DataFrame, student_info: dict) -> bytes:
         "Пәндер:",
     ]
     lines.extend(
-        [
-            f"- {row.subject} | Период: {row.period} | Кредит: {row.credits} | Баға: {row.grade}"
-            for row in report_df.itertuples(index=False)
-        ]
+        (
+            "- " + report_df["subject"].astype(str)
+            + " | Период: " + report_df["period"].astype(str)
+            + " | Кредит: " + report_df["credits"].astype(str)
+            + " | Баға: " + report_df["grade"].astype(str)
+        ).tolist()
     )
 
+    text = pdf.beginText(40, page_height - 40)
+    text.setFont(FONT_NAME, 12, leading=18)
     for line in lines:
-        if y < 40:
+        if text.getY() < 40:
+            pdf.drawText(text)
             pdf.showPage()
-            pdf.setFont(font_name, 12)
-            y = page_height - 40
-        pdf.drawString(40, y, str(line))
-        y -= 18
+            text = pdf.beginText(40, page_height - 40)
+            text.setFont(FONT_NAME, 12, leading=18)
+        text.textLine(str(line))
+    pdf.drawText(text)
 
     pdf.save()
     buffer.seek(0)
     return buffer.getvalue()
 
 
+def build_trend_figure(period_gpa: pd.DataFrame) -> go.Figure:
+    trend_df = period_gpa.sort_values("period_order")
+    fig = go.Figure()
+    for period_type_kz, group in trend_df.groupby("period_type_kz", observed=True):
+        fig.add_scatter(
+            x=group["period_name"].astype(str),
+            y=group["gpa"],
+            mode="lines+markers",
+            name=str(period_type_kz),
+        )
+    fig.update_layout(
+        height=380,
+        title="Тоқсан және семестр бойынша GPA динамикасы",
+        xaxis_title="Период",
+        yaxis_title="GPA",
+        legend_title_text="Период түрі",
+    )
+    return fig
+
+
+def build_excel_bytes(calc_df: pd.DataFrame, period_gpa: pd.DataFrame) -> bytes:
+    buffer = io.BytesIO()
+    # constant_memory is left off: pandas writes cells column by column, which
+    # xlsxwriter's row-streaming mode would silently drop.
+    with pd.ExcelWriter(
+        buffer,
+        engine="xlsxwriter",
+        engine_kwargs={"options": {"strings_to_urls": False, "strings_to_formulas": False}},
+    ) as writer:
+        calc_df.drop(columns=CHART_ONLY_COLUMNS).to_excel(writer, sheet_name="Ulgerim", index=False)
+        period_gpa.drop(columns=CHART_ONLY_COLUMNS).to_excel(writer, sheet_name="Period GPA", index=False)
+    return buffer.getvalue()
+
+
+# ---------------------------
+# Cached computations
+# ---------------------------
+# Streamlit reruns the whole script on every widget change, so everything derived
+# from the records is cached on a hashable snapshot of them. The PDF is not cached
+# because it carries the time it was generated.
+CACHE_MAX_ENTRIES = 32
+
+
+def records_key(records: dict[str, list]) -> tuple:
+    return tuple((column, tuple(records[column])) for column in RECORD_COLUMNS)
+
+
+def store_records(records: dict[str, list]) -> None:
+    # The snapshot is only rebuilt when the records change, not on every rerun.
+    st.session_state.records = records
+    st.session_state.records_snapshot = records_key(records)
+
+
+def records_frame(records: tuple) -> pd.DataFrame:
+    return pd.DataFrame(dict(records))
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def compute_all(records: tuple) -> tuple[pd.DataFrame, float, pd.DataFrame]:
+    # A single cache entry for all derived data. The overall GPA is summed from the
+    # per-period totals, so the row-level arrays are only reduced once.
+    calc_df = normalize_df(records_frame(records))
+    period_gpa = compute_period_gpa(calc_df)
+    total_credits = period_gpa["total_credits"].sum()
+    overall_gpa = period_gpa["total_weighted"].sum() / total_credits if total_credits > 0 else 0.0
+    return calc_df, float(overall_gpa), period_gpa
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def cached_trend_figure(records: tuple) -> go.Figure:
+    _, _, period_gpa = compute_all(records)
+    return build_trend_figure(period_gpa)
+
+
+@st.cache_data(show_spinner=False, max_entries=CACHE_MAX_ENTRIES)
+def cached_excel_bytes(records: tuple) -> bytes:
+    calc_df, _, period_gpa = compute_all(records)
+    return build_excel_bytes(calc_df, period_gpa)
+
+
+def report_pdf_bytes(records: tuple, student_info: tuple) -> bytes:
+    return build_pdf_bytes(records_frame(records), dict(student_info))
+
+
 # ---------------------------
 # Session state
 # ---------------------------
 if "records" not in st.session_state:
-    st.session_state.records = [
-        {"subject": "Математика", "credits": 4, "score_type": "Әріптік", "grade": "A", "period": "Q1"},
-        {"subject": "Физика", "credits": 3, "score_type": "Сандық (0-100)", "grade": 86, "period": "Q1"},
-        {"subject": "Ағылшын тілі", "credits": 2, "score_type": "Әріптік", "grade": "B", "period": "Q2"},
-        {"subject": "Тарих", "credits": 2, "score_type": "Сандық (0-100)", "grade": 92, "period": "Q2"},
-        {"subject": "Информатика", "credits": 3, "score_type": "Әріптік", "grade": "A", "period": "S1"},
-        {"subject": "Биология", "credits": 3, "score_type": "Сандық (0-100)", "grade": 74, "period": "S2"},
-    ]
+    # Records are kept column-wise so the DataFrame is built from ready-made columns.
+    store_records({
+        "subject": ["Математика", "Физика", "Ағылшын тілі", "Тарих", "Информатика", "Биология"],
+        "credits": [4, 3, 2, 2, 3, 3],
+        "score_type": ["Әріптік", "Сандық (0-100)", "Әріптік", "Сандық (0-100)", "Әріптік", "Сандық (0-100)"],
+        "grade": ["A", 86, "B", 92, "A", 74],
+        "period": ["Q1", "Q1", "Q2", "Q2", "S1", "S2"],
+    })
 
 if "student_info" not in st.session_state:
     st.session_state.student_info = {
@@ -234,39 +347,39 @@ with st.sidebar:
             if not subject.strip():
                 st.warning("Пән атауын енгізіңіз.")
             else:
-                st.session_state.records.append(
+                append_record(
+                    st.session_state.records,
                     {
                         "subject": subject.strip(),
                         "credits": float(credits),
                         "score_type": score_type,
                         "grade": grade,
                         "period": period,
-                    }
+                    },
                 )
+                store_records(st.session_state.records)
                 st.success("Жазба қосылды.")
 
     c1, c2 = st.columns(2)
     with c1:
         if st.button("🎲 Деректерді рандомдау", use_container_width=True):
-            st.session_state.records = generate_random_records(6)
+            store_records(generate_random_records(6))
             st.success("Кездейсоқ деректер жүктелді.")
     with c2:
         if st.button("🧹 Барлығын тазалау", use_container_width=True):
-            st.session_state.records = []
+            store_records(empty_records())
             st.info("Барлық жазба өшірілді.")
 
 
 # ---------------------------
 # Build dataframe
 # ---------------------------
-raw_df = pd.DataFrame(st.session_state.records)
-
-if raw_df.empty:
+if not st.session_state.records["subject"]:
     st.warning("Дерек жоқ. Сол жақ панель арқылы пәндерді қосыңыз.")
     st.stop()
 
-calc_df = normalize_df(raw_df)
-overall_gpa = calculate_overall_gpa(calc_df)
+records = st.session_state.records_snapshot
+calc_df, overall_gpa, period_gpa = compute_all(records)
 
 
 # ---------------------------
@@ -289,19 +402,6 @@ m2.metric("📘 Пән саны", f"{calc_df['subject'].nunique()}")
 m3.metric("🧾 Жазба саны", f"{len(calc_df)}")
 
 
-# ---------------------------
-# GPA by period
-# ---------------------------
-period_gpa = (
-    calc_df.groupby(["period_type", "period_name"], as_index=False)
-    .agg(total_weighted=("weighted_points", "sum"), total_credits=("credits", "sum"))
-)
-period_gpa["gpa"] = period_gpa.apply(
-    lambda r: (r["total_weighted"] / r["total_credits"]) if r["total_credits"] > 0 else 0.0,
-    axis=1,
-)
-
-
 # ---------------------------
 # Main layout
 # ---------------------------
@@ -327,27 +427,7 @@ with left:
 
 with right:
     st.subheader("📈 Үлгерім тренді")
-
-    order_map = {"Q1": 1, "Q2": 2, "Q3": 3, "Q4": 4, "S1": 5, "S2": 6}
-    trend_df = period_gpa.copy()
-    trend_df["order_key"] = trend_df["period_name"].map(order_map).fillna(99)
-    trend_df = trend_df.sort_values("order_key")
-
-    trend_df["period_type_kz"] = trend_df["period_type"].replace(
-        {"Quarter": "Тоқсан", "Semester": "Семестр", "Other": "Басқа"}
-    )
-
-    fig = px.line(
-        trend_df,
-        x="period_name",
-        y="gpa",
-        markers=True,
-        color="period_type_kz",
-        title="Тоқсан және семестр бойынша GPA динамикасы",
-        labels={"period_name": "Период", "gpa": "GPA", "period_type_kz": "Период түрі"},
-    )
-    fig.update_layout(height=380, legend_title_text="Период түрі")
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(cached_trend_figure(records), use_container_width=True)
 
 
 # ---------------------------
@@ -378,25 +458,19 @@ with s2:
 st.subheader("⬇️ Есепті жүктеу")
 ex1, ex2 = st.columns(2)
 
+# Exports are built only when the download button is clicked.
 with ex1:
-    excel_buffer = io.BytesIO()
-    with pd.ExcelWriter(excel_buffer, engine="xlsxwriter") as writer:
-        calc_df.to_excel(writer, sheet_name="Ulgerim", index=False)
-        period_gpa.to_excel(writer, sheet_name="Period GPA", index=False)
-    excel_buffer.seek(0)
-
     st.download_button(
         label="Excel есебін жүктеу",
-        data=excel_buffer,
+        data=partial(cached_excel_bytes, records),
         file_name="gpa_esep.xlsx",
         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
     )
 
 with ex2:
-    pdf_bytes = build_pdf_bytes(raw_df, student_info)
     st.download_button(
         label="PDF есебін жүктеу",
-        data=pdf_bytes,
+        data=partial(report_pdf_bytes, records, tuple(student_info.items())),
         file_name="gpa_esep.pdf",
         mime="application/pdf",
     )